@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# Author:   Michael E. Rose <michael.ernst.rose@gmail.com>
+"""Provides a concurrent, rate-limited client for the Scopus APIs used
+by all scripts querying Scopus through pybliometrics.
+
+Requests to the API pass a token bucket per API, set to the quota of
+our API key; stored results are read without waiting.  Failed requests
+are retried with exponential backoff, and results that cannot be parsed
+(or, on request, are empty) are downloaded again once.  Searches over several publication years
+are sent as one range query and split locally.
+
+Responses are stored in one SQLite database keyed by API, query and view
+instead of pybliometrics' cache files.  Stored responses expire after
+the number of days set for the running script in TTL_DAYS.
+
+Long loops of queries can be checkpointed, such that an interrupted
+script resumes where it stopped.
+"""
+
+import atexit
+import sqlite3
+import sys
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps, loads
+from pathlib import Path
+from random import random
+from time import monotonic, sleep, time
+from types import SimpleNamespace
+
+from tqdm import tqdm
+
+N_THREADS = 8  # Number of concurrent queries
+QUOTAS = {  # Requests per second of our API key
+    "AbstractRetrieval": 9,
+    "AffiliationRetrieval": 9,
+    "AuthorRetrieval": 3,
+    "CitationOverview": 4,
+    "ScopusSearch": 9,
+}
+MAX_RETRIES = 5  # Retries of failed requests
+BACKOFF = 1.0  # Seconds to wait before first retry, doubles with each retry
+PARSE_ERRORS = (AttributeError, KeyError, TypeError)  # Malformed results
+EMPTY_REFRESH = 2  # Maximum age in days of empty results downloaded again
+
+STORE_FILE = Path("./002_Scopus_responses/responses.sqlite")
+TTL_DAYS = {  # Maximum age of stored responses in days by script
+    "_110_get_Scopus_bibliometrics": 350,
+    "_130_get_references": 200,
+    "_206_build_coauthor_networks": 50,
+    "_311_list_publications": 100,
+    "_514_compare_citations": 100,
+}
+STAGE = Path(sys.argv[0]).stem
+CHECKPOINT_FOLDER = Path("./002_checkpoints")
+CHECKPOINT_BATCH = 100  # Number of results written to checkpoint at once
+
+_buckets = {}
+_lock = threading.Lock()
+_local = threading.local()
+_stats = Counter()
+
+
+class StoreFolder:
+    """Stand-in for the cache folder of pybliometrics for one API and
+    view, whose files are entries in the response store.
+    """
+    def __init__(self, api, view):
+        self.api = api
+        self.view = view or ""
+
+    def __truediv__(self, name):
+        return StoredResponse(self.api, name, self.view)
+
+
+class StoredResponse:
+    """Stand-in for a cache file of pybliometrics, reading from and
+    writing to the response store.
+    """
+    def __init__(self, api, name, view):
+        self.key = (api, name, view)
+        self._row = None
+
+    def _fetch(self):
+        if self._row is None:
+            row = _connect().execute(
+                "SELECT fetched, content FROM responses "
+                "WHERE api = ? AND query = ? AND view = ?", self.key).fetchone()
+            self._row = row or ()
+        return self._row
+
+    def exists(self):
+        return bool(self._fetch())
+
+    def read_text(self):
+        content = self._fetch()[1]
+        _count(hits=1, bytes_read=len(content))
+        return content
+
+    def stat(self):
+        if not self.exists():
+            raise FileNotFoundError(self.key)
+        return SimpleNamespace(st_mtime=self._fetch()[0])
+
+    def write_text(self, content):
+        self._row = (time(), content)
+        con = _connect()
+        with con:
+            con.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                        (*self.key, *self._row))
+        _count(misses=1, bytes_written=len(content))
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with
+    bursts of up to `capacity` requests.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, waiting until one is available."""
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens)/self.rate
+            sleep(wait)
+
+
+def _connect():
+    """Return connection to the response store for the current thread."""
+    con = getattr(_local, "con", None)
+    if con is None:
+        STORE_FILE.parent.mkdir(exist_ok=True)
+        con = sqlite3.connect(STORE_FILE, timeout=60)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("CREATE TABLE IF NOT EXISTS responses (api TEXT, query TEXT, "
+                    "view TEXT, fetched REAL, content TEXT, "
+                    "PRIMARY KEY (api, query, view))")
+        _local.con = con
+    return con
+
+
+def _count(**kwds):
+    """Update usage statistics of the response store."""
+    with _lock:
+        _stats.update(kwds)
+
+
+def _install_limiter():
+    """Route downloads of pybliometrics through the token buckets and
+    the retry policy.
+    """
+    from pybliometrics.scopus import exception
+    from pybliometrics.scopus.superclasses import base
+    from pybliometrics.scopus.utils import startup
+    from requests.exceptions import ConnectionError, Timeout
+
+    if getattr(base.get_content, "limited", False):
+        return
+    # Disable throttling of pybliometrics, which is not thread-safe
+    for api in startup._throttling_params:
+        startup._throttling_params[api] = deque(maxlen=0)
+    get_content = base.get_content
+    retry_errors = (exception.Scopus500Error, exception.Scopus502Error,
+                    exception.Scopus504Error, ConnectionError, Timeout)
+
+    def limited_get_content(url, api, *args, **kwds):
+        for attempt in range(MAX_RETRIES + 1):
+            with _lock:
+                bucket = _buckets.setdefault(api, TokenBucket(QUOTAS.get(api, 1)))
+            bucket.acquire()
+            try:
+                return get_content(url, api, *args, **kwds)
+            except retry_errors:
+                if attempt == MAX_RETRIES:
+                    raise
+                sleep(BACKOFF * 2**attempt * (1 + random()))
+    limited_get_content.limited = True
+    base.get_content = limited_get_content
+
+
+def _install_store():
+    """Replace the cache files of pybliometrics with the response store."""
+    from pybliometrics.scopus.superclasses import retrieval, search
+
+    if retrieval.get_folder is StoreFolder:
+        return
+    retrieval.get_folder = search.get_folder = StoreFolder
+    atexit.register(report_store)
+
+
+def _key(item):
+    """Return JSON representation of `item` to identify it in checkpoints."""
+    return dumps(item, default=str)
+
+
+def _read_checkpoint(fname):
+    """Return dict of results in checkpoint file `fname`, removing an
+    incomplete last line.
+    """
+    try:
+        lines = fname.read_text().split("\n")
+    except FileNotFoundError:
+        return {}
+    if lines[-1]:
+        lines[-1] = ""
+        fname.write_text("\n".join(lines))
+    return dict(loads(line) for line in lines if line)
+
+
+def map_queries(func, items, n_threads=N_THREADS, desc=None, checkpoint=None):
+    """Apply `func` to all `items` in concurrent threads and return the
+    list of results in the order of `items`.
+
+    With `checkpoint` (a name), results are appended in batches to a
+    checkpoint file of the running script, and items with results in
+    this file are skipped.  Results must be JSON-serializable and are
+    returned as read from JSON.  The file is removed when all items are
+    done.
+    """
+    items = list(items)
+    if checkpoint is None:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            results = executor.map(func, items)
+            return list(tqdm(results, total=len(items), desc=desc))
+    fname = CHECKPOINT_FOLDER/f"{STAGE}_{checkpoint}.jsonl"
+    done = _read_checkpoint(fname)
+    todo = list({_key(item): item for item in items
+                 if _key(item) not in done}.values())
+    if done:
+        print(f"... resuming with {len(items) - len(todo):,} of "
+              f"{len(items):,} results from {fname}")
+    CHECKPOINT_FOLDER.mkdir(exist_ok=True)
+    with ThreadPoolExecutor(max_workers=n_threads) as executor,\
+            open(fname, "a") as ouf:
+        results = executor.map(func, todo)
+        lines = []
+        try:
+            for item, res in zip(todo, tqdm(results, total=len(todo), desc=desc)):
+                line = dumps([_key(item), res])
+                done[_key(item)] = loads(line)[1]
+                lines.append(line + "\n")
+                if len(lines) == CHECKPOINT_BATCH:
+                    ouf.writelines(lines)
+                    ouf.flush()
+                    lines = []
+        finally:
+            ouf.writelines(lines)
+    fname.unlink()
+    return [done[_key(item)] for item in items]
+
+
+def query(api, *args, parse=None, refresh=False, refetch_empty=False,
+          **kwds):
+    """Return object of pybliometrics class `api` (e.g. "ScopusSearch")
+    initiated with `args` and `kwds`, or `parse` applied to it.
+
+    Unless `refresh` is given, stored results expire according to the
+    TTL of the running script.  If the result cannot be parsed, it is
+    downloaded again once.  With `refetch_empty`, an empty result of
+    `parse` older than EMPTY_REFRESH days is downloaded again once.
+    """
+    import pybliometrics.scopus
+
+    _install_store()
+    _install_limiter()
+    if refresh is False:
+        refresh = TTL_DAYS.get(STAGE, False)
+    cls = getattr(pybliometrics.scopus, api)
+    try:
+        obj = cls(*args, refresh=refresh, **kwds)
+        res = parse(obj) if parse else obj
+    except PARSE_ERRORS:
+        if refresh is True:
+            raise
+        refresh = True
+    else:
+        if not refetch_empty or res or refresh is True:
+            return res
+        refresh = EMPTY_REFRESH
+    obj = cls(*args, refresh=refresh, **kwds)
+    return parse(obj) if parse else obj
+
+
+def report_store():
+    """Print usage statistics of the response store."""
+    requests = _stats["hits"] + _stats["misses"]
+    if not requests:
+        return
+    print(f">>> Response store: {_stats['hits']:,} hits and "
+          f"{_stats['misses']:,} misses ({_stats['hits']/requests:.1%} hit "
+          f"rate), {_stats['bytes_read']/1e6:,.1f} MB read and "
+          f"{_stats['bytes_written']/1e6:,.1f} MB written")
+
+
+def search_years(q, first, last, refresh=False):
+    """Return dict mapping each publication year from `first` to `last`
+    to the ScopusSearch results for query `q` in that year (by coverDate),
+    and the number of searches sent.
+
+    All years are searched at once; ranges exceeding the result cap of
+    the API are split in halves.
+    """
+    from pybliometrics.scopus.exception import ScopusQueryError
+
+    if first == last:
+        years = f"PUBYEAR IS {first}"
+    else:
+        years = f"PUBYEAR > {first-1} AND PUBYEAR < {last+1}"
+    try:
+        res = query("ScopusSearch", f"{q} AND {years}", refresh=refresh).results
+    except ScopusQueryError:
+        if first == last:
+            raise
+        middle = (first + last)//2
+        left, n_left = search_years(q, first, middle, refresh)
+        right, n_right = search_years(q, middle+1, last, refresh)
+        return {**left, **right}, 1 + n_left + n_right
+    out = {year: [] for year in range(first, last+1)}
+    for p in res or []:
+        year = int(p.coverDate[:4])
+        if year in out:
+            out[year].append(p)
+    return out, 1
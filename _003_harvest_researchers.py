@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# Author:   Michael E. Rose <michael.ernst.rose@gmail.com>
+"""Harvests publication lists and profiles of researchers from Scopus
+and stores them locally for all scripts working on researchers.
+
+Each researcher is queried only once; subsequent requests for the same
+researcher are answered from the stores until the records are older than
+the TTL of the running script (see TTL_DAYS in _002_query_Scopus.py).
+"""
+
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from _002_query_Scopus import STAGE, TTL_DAYS, map_queries, query
+
+DOCUMENTS_FILE = Path("./003_researchers/documents.csv")
+PROFILES_FILE = Path("./003_researchers/profiles.csv")
+
+DOCUMENT_COLUMNS = ["researcher", "eid", "source", "year", "subtype",
+                    "author_ids", "author_afids"]
+PROFILE_COLUMNS = ["researcher", "given_name", "surname"]
+
+
+def get_documents(researchers):
+    """Return DataFrame of documents of `researchers` (one row per
+    researcher and document), querying only researchers not yet harvested.
+    """
+    df = harvest(researchers, DOCUMENTS_FILE, search_documents,
+                 DOCUMENT_COLUMNS)
+    df["year"] = df["year"].astype(int)
+    return df
+
+
+def get_profiles(researchers):
+    """Return DataFrame of Scopus profiles of `researchers`, querying
+    only researchers not yet harvested.
+    """
+    return harvest(researchers, PROFILES_FILE, retrieve_profile,
+                   PROFILE_COLUMNS).set_index("researcher")
+
+
+def harvest(researchers, fname, func, columns):
+    """Return records of `researchers` from store `fname`, after adding
+    records obtained from `func` for missing or expired researchers.
+
+    Records carry the date they were fetched and expire after the TTL of
+    the running script.  Researchers without records are stored as rows
+    without information, researchers whose query failed are not stored
+    (and keep their expired records).
+    """
+    researchers = {str(r) for r in researchers}
+    try:
+        store = pd.read_csv(fname, dtype=str)
+    except FileNotFoundError:
+        store = pd.DataFrame(columns=columns + ["fetched"])
+    if "fetched" not in store:
+        store["fetched"] = None
+    current = store["researcher"]
+    ttl = TTL_DAYS.get(STAGE)
+    if ttl:
+        cutoff = (date.today() - timedelta(days=ttl)).isoformat()
+        current = current[store["fetched"].fillna("") >= cutoff]
+    missing = sorted(researchers - set(current))
+    print(f"... harvesting {len(missing):,} of {len(researchers):,} "
+          f"researchers missing or expired in {fname}")
+    if missing:
+        results = map_queries(func, missing, checkpoint=fname.stem)
+        new = [rec for auth_id, res in zip(missing, results)
+               if res is not None for rec in res or [(auth_id,)]]
+        new = pd.DataFrame(new, columns=columns, dtype=str)
+        new["fetched"] = date.today().isoformat()
+        store = store[~store["researcher"].isin(new["researcher"])]
+        store = pd.concat([store, new]).sort_values("researcher", kind="stable")
+        fname.parent.mkdir(exist_ok=True)
+        store.to_csv(fname, index=False)
+    store = store.loc[store["researcher"].isin(researchers), columns]
+    store = store.dropna(subset=columns[1:], how="all")
+    return store.where(store.notnull(), None).reset_index(drop=True)
+
+
+def retrieve_profile(auth_id):
+    """Return names of an author's Scopus profile."""
+    try:
+        au = query("AuthorRetrieval", auth_id)
+    except Exception as e:
+        print(auth_id, e)
+        return None
+    return [(auth_id, au.given_name, au.surname)]
+
+
+def search_documents(auth_id):
+    """Return EID, source, publication year, subtype, author IDs and
+    author affiliation IDs of all documents of an author.
+    """
+    def parse(s):
+        return [(auth_id, p.eid, p.publicationName, p.coverDate[:4],
+                 p.subtype, p.author_ids, p.author_afids)
+                for p in s.results or []]
+
+    try:
+        return query("ScopusSearch", f"AU-ID({auth_id})", parse=parse)
+    except Exception as e:
+        print(auth_id, e)
+        return None
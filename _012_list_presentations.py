@@ -4,7 +4,14 @@
 at specific NBER Summer Institutes and writes statistics of presentations.
 """
 
+import sys
+from datetime import datetime, timedelta
+from hashlib import sha256
+from json import dumps, loads
 from pathlib import Path
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
 
 import pandas as pd
 
@@ -14,6 +21,11 @@ SCOPUS_FILE = Path("./005_identifiers/discussants.csv")
 AFFMAP_FILE = Path("./010_affiliation_mappings/tilburg.csv")
 TARGET_FILE = Path("./012_presentations/entries.csv")
 OUTPUT_FOLDER = Path("./990_output")
+CACHE_FOLDER = Path("./001_remote_files")
+MANIFEST_FILE = CACHE_FOLDER/"manifest.json"
+
+CACHE_DAYS = 30  # Serve local copies younger than this without revalidation
+OFFLINE = "--offline" in sys.argv  # Never touch the network
 
 MEETINGS_WITH = ['IFM', 'EFEL', 'AP', 'CF', 'RISK', 'AMRE', 'REAL', 'PERE']
 MEETINGS_WITHOUT = ['EFCE', 'EFFE', 'ME']
@@ -35,6 +47,53 @@ def clean_discussant(s):
     return s + ";"
 
 
+def fetch(url, max_age=CACHE_DAYS):
+    """Return path to local copy of remote file at `url`.
+
+    Files are stored under their SHA-256 hash in CACHE_FOLDER and listed
+    in MANIFEST_FILE with URL, ETag and fetch time.  Copies younger than
+    `max_age` days are served from disk; older ones are revalidated with
+    their ETag.  With OFFLINE only local copies are used.
+    """
+    try:
+        manifest = loads(MANIFEST_FILE.read_text())
+    except FileNotFoundError:
+        manifest = {}
+    entry = manifest.get(url)
+    if entry and not (CACHE_FOLDER/entry["file"]).exists():
+        entry = None
+    if entry:
+        age = datetime.now() - datetime.fromisoformat(entry["fetched"])
+        if OFFLINE or age < timedelta(days=max_age):
+            return CACHE_FOLDER/entry["file"]
+    elif OFFLINE:
+        raise FileNotFoundError(f"No local copy of {url} in offline mode")
+    # Download or revalidate
+    request = Request(url)
+    if entry and entry["etag"]:
+        request.add_header("If-None-Match", entry["etag"])
+    try:
+        with urlopen(request) as response:
+            content = response.read()
+            etag = response.headers.get("ETag")
+        fname = sha256(content).hexdigest() + Path(urlparse(url).path).suffix
+        CACHE_FOLDER.mkdir(exist_ok=True)
+        (CACHE_FOLDER/fname).write_bytes(content)
+    except HTTPError as err:
+        if not entry or err.code != 304:  # 304: Not modified
+            raise
+        fname, etag = entry["file"], entry["etag"]
+    except URLError as err:
+        if not entry:
+            raise
+        print(f"... using local copy of {url} ({err.reason})")
+        return CACHE_FOLDER/entry["file"]
+    manifest[url] = {"file": fname, "etag": etag,
+                     "fetched": datetime.now().isoformat(timespec="seconds")}
+    MANIFEST_FILE.write_text(dumps(manifest, indent=2, sort_keys=True))
+    return CACHE_FOLDER/fname
+
+
 def find_affiliations(authors, sep=";"):
     """Extract affiliation information from author information."""
     def clean_aff(name):
@@ -80,9 +139,9 @@ def read_tilburg_rankings(interpolated=True):
     unweighted += ".csv"
     weighted += ".csv"
     # Read in
-    df1 = (pd.read_csv(unweighted, index_col=[0, 1])
+    df1 = (pd.read_csv(fetch(unweighted), index_col=[0, 1])
              .add_prefix("Tilburg_").add_suffix("_unweighted"))
-    df2 = (pd.read_csv(weighted, index_col=[0, 1])
+    df2 = (pd.read_csv(fetch(weighted), index_col=[0, 1])
              .add_prefix("Tilburg_").add_suffix("_weighted"))
     return (df1.join(df2, how="outer").reset_index()
                .rename(columns={"University": "aff"}))
@@ -98,7 +157,7 @@ def write_stats(stat_dct):
 
 def main():
     # Read in and subset
-    nber = pd.read_csv(NBER_FILE).drop(columns="session")
+    nber = pd.read_csv(fetch(NBER_FILE)).drop(columns="session")
     nber["link"] = (~nber["link"].isnull())*1
     nber["title"] = nber["title"].str.upper().replace(TITLE_CORRECTION)
     idx_cols = list(nber.columns)
@@ -3,29 +3,37 @@
 """Collects gender estimates from genderize.io.
 
 This script was written for free usage of genderize, which
-allows 1000 requests/day.  Run this script continuously on separate days
-to obtain all the information.
+allows 1000 names/day.  Run this script continuously on separate days
+to obtain all the information.  Names are looked up in batches and
+stored, and the remaining quota is recorded such that runs before the
+quota resets send no requests.
 """
 
-from collections import OrderedDict
+from datetime import datetime, timedelta
+from json import dumps, loads
 from pathlib import Path
 
 import genderize
 import pandas as pd
 from tqdm import tqdm
 
+from _003_harvest_researchers import get_profiles
+
 NBER_FILE = Path("./012_presentations/entries.csv")
 TARGET_FILE = Path("./030_gender_estimates/genderize.csv")
+NAMES_FILE = Path("./030_gender_estimates/names.csv")
+QUOTA_FILE = Path("./030_gender_estimates/quota.json")
 
+BATCH_SIZE = 10  # Maximum number of names per request to genderize
+COLUMNS = ["count", "gender", "name", "probability"]
 
-def get_firstname(auth_id, refresh=False):
-    """Return usable first name of Scopus Author profile."""
-    from unicodedata import normalize
 
-    from pybliometrics.scopus import AuthorRetrieval
+def get_firstname(given):
+    """Return usable first name from given name of Scopus Author profile."""
+    from unicodedata import normalize
 
-    au = AuthorRetrieval(auth_id, refresh=refresh)
-    given = au.given_name
+    if not given:
+        return None
     new = normalize('NFKD', given).encode('ascii', 'ignore').decode("utf8")
     firsts = [part for part in new.split() if
               len(part) > 1 and not part.endswith(".")]
@@ -36,6 +44,70 @@ def get_firstname(auth_id, refresh=False):
         return None
 
 
+def lookup_genders(queue):
+    """Look up genders of names in `queue` in batches while the quota
+    lasts, appending estimates to the name store.
+    """
+    client = genderize.Genderize()
+    remaining = read_quota()
+    with tqdm(total=len(queue)) as pbar:
+        while queue and remaining != 0:
+            size = min(BATCH_SIZE, remaining or BATCH_SIZE)
+            batch, queue = queue[:size], queue[size:]
+            try:
+                resp = client.get(batch, retheader=True)
+            except genderize.GenderizeException as e:
+                # Exception carries message, HTTP status and headers
+                if len(e.args) < 3 or e.args[1] != 429:
+                    raise
+                write_quota(e.args[-1], remaining=0)  # Daily quota exceeded
+                queue = batch + queue
+                break
+            new = pd.DataFrame(resp["data"], index=batch).reindex(columns=COLUMNS)
+            new.to_csv(NAMES_FILE, mode="a", header=not NAMES_FILE.exists(),
+                       index_label="first")
+            remaining = write_quota(resp["headers"])
+            pbar.update(len(batch))
+    if queue:
+        print(f">>> Quota exhausted with {len(queue):,} names left")
+
+
+def read_names():
+    """Read store of gender estimates by name."""
+    try:
+        return pd.read_csv(NAMES_FILE, index_col="first",
+                           converters={"first": str})
+    except FileNotFoundError:
+        return pd.DataFrame(columns=COLUMNS)
+
+
+def read_quota():
+    """Return remaining quota of genderize, or None if unknown or reset."""
+    try:
+        state = loads(QUOTA_FILE.read_text())
+    except FileNotFoundError:
+        return None
+    if datetime.fromisoformat(state["reset"]) <= datetime.now():
+        return None
+    print(f">>> {state['remaining']:,} names left in quota until {state['reset']}")
+    return state["remaining"]
+
+
+def write_quota(headers, remaining=None):
+    """Record remaining quota of genderize and its reset time from response
+    headers, and return the remaining quota.
+    """
+    if remaining is None:
+        if "X-Rate-Limit-Remaining" not in headers:
+            return None
+        remaining = int(headers["X-Rate-Limit-Remaining"])
+    seconds = int(headers.get("X-Rate-Limit-Reset", 86400))
+    reset = datetime.now() + timedelta(seconds=seconds)
+    state = {"remaining": remaining, "reset": reset.isoformat(timespec="seconds")}
+    QUOTA_FILE.write_text(dumps(state))
+    return remaining
+
+
 def main():
     # Read in
     nber = pd.read_csv(NBER_FILE, index_col=0)
@@ -58,25 +130,19 @@ def main():
     df = pd.DataFrame(index=sorted(discussants))
     df = df.drop(index=collected.index, errors="ignore").dropna()
     print(f">>> Getting usable first name of {df.shape[0]} discussants")
-    df["first"] = df.index.map(get_firstname)
+    given = get_profiles(df.index)["given_name"].to_dict()
+    df["first"] = [get_firstname(given.get(d)) for d in df.index]
     df = df.dropna(subset=["first"])
 
     # Estimate gender for each name
-    search_for = set(df["first"].unique())
-    print(f">>> Looking up gender of {len(search_for):,} distinct names")
-    estimates = OrderedDict()
-    for name in tqdm(search_for):
-        try:
-            resp = genderize.Genderize().get([name])
-            estimates[name] = resp[0]
-        except genderize.GenderizeException:  # Daily quota exceeded
-            break
+    queue = sorted(set(df["first"]) - set(read_names().index))
+    print(f">>> Looking up gender of {len(queue):,} distinct names")
+    lookup_genders(queue)
 
     # Write out
-    if estimates:
-        new = pd.DataFrame(estimates).T
-        df = df.join(new, how="right", on="first")
-        df = df[["count", "gender", "name", "probability"]]
+    df = df.join(read_names(), how="inner", on="first")
+    if not df.empty:
+        df = df[COLUMNS]
         collected = pd.concat([collected, df])
         collected = collected.sort_index()
         collected["count"] = collected["count"].fillna(0).astype(int).replace(0, "")
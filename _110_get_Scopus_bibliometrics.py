@@ -7,8 +7,8 @@ from pathlib import Path
 
 import pandas as pd
 from numpy import cumsum
-from pybliometrics.scopus import AbstractRetrieval, CitationOverview
-from tqdm import tqdm
+
+from _002_query_Scopus import map_queries, query
 
 SOURCE_FILE = Path("020_title_mapping/mapping.csv")
 TARGET_FILE = Path("110_bibliometrics/metrics.csv")
@@ -19,8 +19,6 @@ PAGE_RANGES = {
     "2-s2.0-84920752219": 25,
 }
 
-tqdm.pandas()
-
 _copyright = {'copyright', '©', ' (c) ', ' 5555 ', 'published by ',
               'this is an abstract of a paper presented'}
 _remove = {"Original is an abstract.", "Summary form only given.",
@@ -86,9 +84,9 @@ def count_pages(s):
     return r
 
 
-def get_bibliometrics(eid, refresh=350, current_year=2022):
+def get_bibliometrics(eid, current_year=2022):
     """Retrieve Scopus abstracts and extract bibliometric information."""
-    ab = AbstractRetrieval(eid, view='FULL', refresh=refresh)
+    ab = query("AbstractRetrieval", eid, view='FULL')
     pubyear = int(ab.coverDate.split("-")[0])
     # Basic bibliometric information
     s = pd.Series(dtype=object)
@@ -102,7 +100,7 @@ def get_bibliometrics(eid, refresh=350, current_year=2022):
     s['abstract'] = ab.abstract or ab.description
     # Yearly cumulated citations
     sid = eid.split("-")[-1]
-    co = CitationOverview([sid], start=pubyear, end=current_year, refresh=refresh)
+    co = query("CitationOverview", [sid], start=pubyear, end=current_year)
     cc = [(t[0], t[1]) for t in co.cc[0] if t[0] < current_year]
     years, cites = list(zip(*cc))
     s['total_citations'] = sum(cites)
@@ -120,7 +118,8 @@ def main():
 
     # Get bibliometrics
     print(f">>> Retrieving bibliometric information from Scopus...")
-    bibl = df["eid"].progress_apply(get_bibliometrics)
+    bibl = pd.DataFrame(map_queries(get_bibliometrics, df["eid"]),
+                        index=df.index)
     bibl['num_pages'] = bibl.apply(count_pages, axis=1)
     bibl = bibl.drop(columns="pages")
     bibl.loc[bibl["source"] == 17357, "type"] = "Journal"  # IMF Staff Papers
@@ -5,9 +5,8 @@
 from pathlib import Path
 
 import pandas as pd
-from tqdm import tqdm
-from pybliometrics.scopus import ScopusSearch
 
+from _002_query_Scopus import map_queries, query, search_years
 from _012_list_presentations import DATA_RANGE
 
 SOURCE_FILE = Path("./119_NBER_sample/manuscripts.csv")
@@ -19,12 +18,8 @@ JOURNALS = (("AER", 22697), ("ECTMA", 19482), ("JPE", 24404),
 
 def get_references(eid, refresh=False):
     """Retrieve list of resolved (=indexed) references for a document."""
-    from pybliometrics.scopus import AbstractRetrieval
-    ab = AbstractRetrieval(eid, view='REF', refresh=refresh)
-    ref_list = ab.references or []
-    if not ref_list:
-        ab = AbstractRetrieval(eid, view='REF', refresh=2)
-        ref_list = ab.references or []
+    ref_list = query("AbstractRetrieval", eid, view='REF', refresh=refresh,
+                     parse=lambda ab: ab.references or [], refetch_empty=True)
     ref_list = [ref for ref in ref_list if ref.type == "resolvedReference"]
     refs = "|".join([r.id for r in ref_list])
     journals = "|".join([r.sourcetitle for r in ref_list if r.sourcetitle])
@@ -37,27 +32,29 @@ def main():
     df = pd.read_csv(SOURCE_FILE, usecols=cols).dropna(subset=["eid"])
     df = df.set_index("eid")
     print(f">>> Retrieving references for {df.shape[0]:,} NBER publications")
-    refs = {}
-    for eid in tqdm(df.index):
-        refs[eid] = get_references(eid)
+    refs = map_queries(get_references, df.index, checkpoint="NBER")
+    refs = dict(zip(df.index, refs))
     refs = pd.DataFrame(refs).T
     out = pd.concat([df, refs], axis=1)
     out.to_csv(TARGET_FOLDER/"NBER.csv", index_label="eid")
 
     # Get references for publications in other journals
-    for key, source_id in JOURNALS:
-        pubs = []
-        for y in DATA_RANGE:
-            q = f"SOURCE-ID({source_id}) AND PUBYEAR IS {y}"
-            s = ScopusSearch(q, refresh=200)
-            pubs.extend(s.results)
+    first, last = min(DATA_RANGE), max(DATA_RANGE)
+    searches = map_queries(
+        lambda s: search_years(f"SOURCE-ID({s})", first, last),
+        [source_id for _, source_id in JOURNALS])
+    n_searches = sum(n for _, n in searches)
+    n_years = len(JOURNALS)*len(DATA_RANGE)
+    print(f">>> Sent {n_searches:,} searches instead of {n_years:,} "
+          f"({n_years - n_searches:,} saved)")
+    for (key, _), (res, _) in zip(JOURNALS, searches):
+        pubs = [p for year in DATA_RANGE for p in res[year]]
         print(f">>> Retrieving references for {len(pubs):,} {key} publications")
         refs = {}
-        for pub in tqdm(pubs):
-            eid = pub.eid
-            new = {"year": pub.coverDate[:4]}
-            new.update(get_references(eid))
-            refs[eid] = new
+        results = map_queries(get_references, [p.eid for p in pubs],
+                              checkpoint=key)
+        for pub, new in zip(pubs, results):
+            refs[pub.eid] = {"year": pub.coverDate[:4], **new}
         out = pd.DataFrame(refs).T
         out.to_csv((TARGET_FOLDER/key).with_suffix(".csv"), index_label="eid")
 
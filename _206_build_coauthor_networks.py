@@ -4,62 +4,292 @@
 in t-1, t and t+1.
 """
 
-from collections import defaultdict
-from itertools import combinations
+from array import array
 from pathlib import Path
+from xml.etree.ElementTree import iterparse
 
 import networkx as nx
+import numpy as np
 import pandas as pd
-from pybliometrics.scopus import ScopusSearch
+from scipy.sparse import csr_matrix, triu
 
+from _002_query_Scopus import map_queries, search_years
 from _012_list_presentations import DATA_RANGE
 
 SOURCE_FILE = Path("005_identifiers/journals.csv")
 TARGET_FOLDER = Path("./206_coauthor_networks")
+TEMPORAL_FILE = TARGET_FOLDER/"temporal_edges.npz"
 
 SPAN = 3  # Number of years for each network
 LEAD = 2  # Number of years to look forward (i.e. the publication lag)
 _doctypes = {'cp', 'ar', 're', 'no', 'sh', 'ip'}  # Document types we keep
 
 
+def build_temporal_edges(auth_groups, pub_counts):
+    """Aggregate author groups of publications by year into temporal
+    edge records (see temporal_edge_arrays()).
+
+    `auth_groups` maps publication years to lists of lists of author IDs,
+    `pub_counts` maps publication years to the number of publications.
+    Co-authorships are counted by projecting the author-paper incidence
+    matrix B of each year onto authors (B*B.T).  Records with
+    author_a == author_b count an author's publications and define the
+    nodes.
+    """
+    # Author-paper incidence of all years
+    years = list(auth_groups)
+    sizes = [len(g) for y in years for g in auth_groups[y]]
+    ids = np.array([a for y in years for g in auth_groups[y] for a in g],
+                   dtype="uint64")
+    paper = np.repeat(np.arange(len(sizes)), sizes)
+    paper_year = np.repeat(years, [len(auth_groups[y]) for y in years])
+    authors, auth = np.unique(ids, return_inverse=True)
+    B = csr_matrix((np.ones(len(ids), dtype="uint32"), (auth, paper)),
+                   shape=(len(authors), len(sizes)))
+    B.data[:] = 1  # Count repeated authors once
+    # Project each year onto authors
+    records = []
+    for year in years:
+        C = B[:, paper_year == year]
+        C = triu(C @ C.T).tocoo()
+        records.append((C.row, C.col, np.full(C.nnz, year), C.data))
+    a, b, pub_year, count = map(np.concatenate, zip(*records))
+    return temporal_edge_arrays(authors[a], authors[b], pub_year, count,
+                                pub_counts)
+
+
+def count_publications(store, year, span=SPAN, lead=LEAD):
+    """Return number of publications in the window of `year`."""
+    first, last = publication_years(year, span, lead)
+    mask = (store["years"] >= first) & (store["years"] <= last)
+    return int(store["pub_counts"][mask].sum())
+
+
+def export_gexf(fname, ouf=None):
+    """Convert network file written by write_network() to GEXF (e.g.
+    for Gephi).
+    """
+    nodes, A, directed, weighted = read_network(fname, with_info=True)
+    G = nx.DiGraph() if directed else nx.Graph()
+    G.add_nodes_from(nodes)
+    A = A.tocoo()
+    edges = zip(nodes[A.row], nodes[A.col], A.data.astype(float))
+    if weighted:
+        G.add_weighted_edges_from(edges)
+    else:
+        G.add_edges_from((u, v) for u, v, _ in edges)
+    nx.write_gexf(G, ouf or Path(fname).with_suffix(".gexf"))
+
+
+def materialize_network(store, year, span=SPAN, lead=LEAD):
+    """Return sorted node IDs and sparse adjacency matrix (rows are
+    sources) for `year` from temporal edge records, using publications
+    in the window given by `span` and `lead`.
+
+    Entries are the summed counts of the records in the window.  In
+    undirected stores records on the diagonal only define the nodes.
+    """
+    first, last = publication_years(year, span, lead)
+    mask = (store["pub_year"] >= first) & (store["pub_year"] <= last)
+    a = store["author_a"][mask]
+    b = store["author_b"][mask]
+    count = store["count"][mask].astype("float64")
+    if store["directed"]:
+        keep = np.union1d(a, b)
+    else:
+        loop = a == b
+        keep = np.unique(a[loop])
+        a, b = a[~loop], b[~loop]
+        a, b = np.concatenate([a, b]), np.concatenate([b, a])
+        count = np.tile(count[~loop], 2)
+    A = csr_matrix((count, (np.searchsorted(keep, a), np.searchsorted(keep, b))),
+                   shape=(len(keep), len(keep)))
+    return store["authors"][keep], A
+
+
+def publication_years(year, span=SPAN, lead=LEAD):
+    """Return first and last publication year of the window of `year`."""
+    return year + lead - span + 1, year + lead
+
+
+def read_gexf(fname, with_info=False):
+    """Stream network from GEXF file into arrays without building a
+    networkx graph.
+
+    Return values are the same as for read_network().  Undirected edges
+    are stored in both directions; edges without weight have weight 1.
+    """
+    index = {}
+    sources, targets = array("q"), array("q")
+    values = array("f")
+    directed = weighted = False
+    parent = None
+    for event, elem in iterparse(fname, events=("start", "end")):
+        tag = elem.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            if tag == "graph":
+                directed = elem.get("defaultedgetype") == "directed"
+            elif tag in ("nodes", "edges"):
+                parent = elem
+            continue
+        if tag == "node":
+            index.setdefault(elem.get("id"), len(index))
+        elif tag == "edge":
+            u = index.setdefault(elem.get("source"), len(index))
+            v = index.setdefault(elem.get("target"), len(index))
+            weight = elem.get("weight")
+            weighted |= weight is not None
+            weight = float(weight or 1)
+            sources.append(u)
+            targets.append(v)
+            values.append(weight)
+            if u != v and elem.get("type", "directed" if directed
+                                   else "undirected") == "undirected":
+                sources.append(v)
+                targets.append(u)
+                values.append(weight)
+        else:
+            continue
+        parent.clear()
+    # Sort nodes like read_network()
+    nodes = np.array(list(index), dtype=str)
+    del index
+    order = np.argsort(nodes, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    A = csr_matrix((np.frombuffer(values, dtype="float32"),
+                    (rank[np.frombuffer(sources, dtype="int64")],
+                     rank[np.frombuffer(targets, dtype="int64")])),
+                   shape=(len(nodes), len(nodes)))
+    A.sum_duplicates()
+    if with_info:
+        return nodes[order], A, directed, weighted
+    return nodes[order], A
+
+
+def read_network(fname, with_info=False):
+    """Read network written by write_network().
+
+    Return array of node IDs (as strings, in the order of the rows and
+    columns of the matrix), the sparse adjacency matrix (with edge weights
+    if available) and whether the network is directed and weighted (if
+    `with_info` is True).
+    """
+    with np.load(fname) as data:
+        nodes = data["nodes"].astype(str)
+        weighted = "weight" in data
+        if weighted:
+            values = data["weight"]
+        else:
+            values = np.ones(len(data["indices"]), dtype="float32")
+        A = csr_matrix((values, data["indices"], data["indptr"]),
+                       shape=(len(nodes), len(nodes)))
+        directed = bool(data["directed"])
+    if with_info:
+        return nodes, A, directed, weighted
+    return nodes, A
+
+
+def read_temporal_edges(fname=TEMPORAL_FILE):
+    """Read temporal edge records written by main() into dict of arrays."""
+    with np.load(fname) as data:
+        return dict(data)
+
+
+def temporal_edge_arrays(author_a, author_b, pub_year, count, pub_counts,
+                         directed=False):
+    """Return dict of arrays for temporal edge records, one per pair of
+    IDs in `author_a` and `author_b`, publication year and count (or
+    weight).
+
+    Arrays are the sorted author IDs ("authors", as uint64 if all are
+    Scopus IDs), the records ("author_a", "author_b" as indices into
+    "authors", "pub_year", "count"), the publication counts per year
+    ("years", "pub_counts") and whether records are directed
+    ("directed").
+    """
+    ids = np.concatenate([np.asarray(author_a), np.asarray(author_b)])
+    if ids.dtype.kind == "u" or all(str(a).isdigit() for a in ids):
+        ids = ids.astype("uint64")
+    else:
+        ids = ids.astype(str)
+    authors, idx = np.unique(ids, return_inverse=True)
+    idx = idx.reshape(2, -1)
+    count = np.asarray(count)
+    if count.dtype.kind in "iu":
+        count = count.astype("uint32")
+    years = sorted(pub_counts)
+    return {"authors": authors,
+            "author_a": idx[0].astype("int64"),
+            "author_b": idx[1].astype("int64"),
+            "pub_year": np.asarray(pub_year, dtype="int16"),
+            "count": count,
+            "years": np.array(years, dtype="int16"),
+            "pub_counts": np.array([pub_counts[y] for y in years],
+                                   dtype="int64"),
+            "directed": np.array(directed)}
+
+
+def write_arrays(fname, nodes, A, directed=False, weighted=True):
+    """Write sorted node IDs and sparse adjacency matrix (rows are
+    sources) as compressed arrays in the format of write_network().
+    """
+    A = csr_matrix(A)
+    arrays = {"indptr": A.indptr.astype("int64"),
+              "indices": A.indices.astype("int64"),
+              "directed": np.array(directed)}
+    if all(str(n).isdigit() for n in nodes):
+        arrays["nodes"] = np.array([int(n) for n in nodes], dtype="uint64")
+    else:
+        arrays["nodes"] = np.array(nodes, dtype=str)
+    if weighted:
+        arrays["weight"] = A.data.astype("float32")
+    np.savez_compressed(fname, **arrays)
+
+
+def write_network(G, fname):
+    """Write network as compressed arrays: sorted node IDs (as uint64
+    if all are Scopus IDs), CSR adjacency matrix (rows are sources) and
+    edge weights as float32 (if any edge has weights).
+    """
+    nodes = sorted(G.nodes())
+    A = nx.adjacency_matrix(G, nodelist=nodes, weight="weight")
+    weighted = any("weight" in d for _, _, d in G.edges(data=True))
+    write_arrays(fname, nodes, A, G.is_directed(), weighted)
+
+
 def main():
     # Read in
     source_ids = pd.read_csv(SOURCE_FILE)['Scopus ID'].dropna().astype("uint64").unique()
-    G = defaultdict(lambda: nx.Graph())
-    pub_counts = defaultdict(lambda: 0)
+    auth_groups = {}
+    pub_counts = {}
 
     # Iterate over publication lists
-    print(">>> Parsing publications for ...")
-    for year in range(min(DATA_RANGE), max(DATA_RANGE)+SPAN):
-        print("...", str(year))
-        cur_count = 0
-        nodes = []
-        edges = []
-        for source_id in source_ids:
-            # Get publications
-            q = f'SOURCE-ID({source_id}) AND PUBYEAR IS {year}'
-            res = ScopusSearch(q, refresh=50).results or []
-            pubs = [p for p in res if p.author_ids and p.subtype in _doctypes]
-            cur_count += len(pubs)
-            # Create edges
-            auth_groups = [p.author_ids.split(";") for p in pubs]
-            nodes.extend([a for sl in auth_groups for a in sl])
-            new_edges = [list(combinations(group, 2)) for group in auth_groups]
-            edges.extend([tuple(sorted(pair)) for sl in new_edges for pair in sl])
-        # Build network and append to other years
-        H = nx.Graph()
-        H.add_nodes_from(nodes)
-        H.add_edges_from(edges)
-        for cur_year in range(year-LEAD, year-LEAD+SPAN):
-            if cur_year < min(DATA_RANGE) or cur_year > max(DATA_RANGE):
-                continue
-            G[cur_year] = nx.compose(G[cur_year], H)
-            pub_counts[cur_year] += cur_count
+    first = publication_years(min(DATA_RANGE))[0]
+    last = publication_years(max(DATA_RANGE))[1]
+    print(f">>> Parsing publications for {first}-{last} ...")
+    results = map_queries(
+        lambda s: search_years(f"SOURCE-ID({s})", first, last),
+        source_ids)
+    n_searches = sum(n for _, n in results)
+    n_years = len(source_ids)*(last - first + 1)
+    print(f"... sent {n_searches:,} searches instead of {n_years:,} "
+          f"({n_years - n_searches:,} saved)")
+    for year in range(first, last+1):
+        pubs = [p for res, _ in results for p in res[year]
+                if p.author_ids and p.subtype in _doctypes]
+        pub_counts[year] = len(pubs)
+        auth_groups[year] = [p.author_ids.split(";") for p in pubs]
 
     # Write out
-    for year, network in G.items():
-        ouf = (TARGET_FOLDER/str(year)).with_suffix(".gexf")
-        nx.write_gexf(network, ouf)
+    store = build_temporal_edges(auth_groups, pub_counts)
+    np.savez_compressed(TEMPORAL_FILE, **store)
+    for year in DATA_RANGE:
+        nodes, A = materialize_network(store, year)
+        print(f"... {year}: {len(nodes):,} authors of "
+              f"{count_publications(store, year):,} publications")
+        ouf = (TARGET_FOLDER/str(year)).with_suffix(".npz")
+        write_arrays(ouf, nodes, A)
 
 
 if __name__ == '__main__':
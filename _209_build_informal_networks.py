@@ -4,35 +4,42 @@
 in t-1, t and t+1.
 """
 
-from collections import Counter, defaultdict
-from itertools import combinations, product
+from collections import Counter
+from itertools import product
 from json import loads
 from pathlib import Path
-from urllib.request import urlopen
 
 import networkx as nx
+import numpy as np
 import pandas as pd
 
-from _012_list_presentations import write_stats, DATA_RANGE
-from _206_build_coauthor_networks import LEAD, SPAN
+from _012_list_presentations import fetch, write_stats, DATA_RANGE
+from _206_build_coauthor_networks import publication_years,\
+    temporal_edge_arrays, write_network
 
 ACK_FILE = "https://raw.githubusercontent.com/Michael-E-Rose/CoFE/"\
            "master/acks_min.json"
 EDITOR_FILE = Path("./035_person_auxiliary/editor_tenures.csv")
 TARGET_FOLDER = Path("./209_informal_networks/")
+TEMPORAL_FILE = TARGET_FOLDER/"temporal_edges.npz"
 
 
-def add_attribute(network, edges, val, attr='weight'):
-    """Creates, appends or increases attribute of edges"""
-    for entry in edges:
-        d = network.edges[entry[0], entry[1]]
-        try:
-            if isinstance(d[attr], str):
-                d[attr] += ";" + val  # append
-            else:
-                d[attr] += val  # increase
-        except KeyError:
-            d[attr] = val  # create
+def sum_weights(keys, values):
+    """Sum `values` over equal rows of `keys` (list of arrays), adding up
+    in input order.
+
+    Returns list of arrays with the unique rows (in order of their first
+    occurrence) and the array of sums.
+    """
+    codes = np.zeros(len(values), dtype="int64")
+    for key in keys:
+        code, uniques = pd.factorize(key)
+        codes = codes*len(uniques) + code
+    _, first, inverse = np.unique(codes, return_index=True,
+                                  return_inverse=True)
+    sums = np.bincount(inverse, weights=values)
+    order = np.argsort(first)
+    return [np.asarray(key)[first[order]] for key in keys], sums[order]
 
 
 def main():
@@ -40,11 +47,16 @@ def main():
     eds = pd.read_csv(EDITOR_FILE).dropna(subset=['scopus_id'])
     eds = eds[eds['managing_editor'] == 1]
     eds['scopus_id'] = eds['scopus_id'].astype("uint64").astype(str)
-    acks = loads(urlopen(ACK_FILE).read().decode("utf-8"))['data']
+    editors = eds.groupby(['journal', 'year'])['scopus_id'].agg(set).to_dict()
+    acks = loads(fetch(ACK_FILE).read_text(encoding="utf-8"))['data']
     papers_with = 0
+    pub_counts = Counter()
 
-    # GENERATE NETWORKS
-    G = defaultdict(lambda: nx.DiGraph(name="both"))
+    # COLLECT WEIGHTED LINKS
+    sources = []
+    targets = []
+    years = []
+    values = []
     for item in acks:
         pub_year = item['year']
         journal = item['journal']
@@ -56,25 +68,40 @@ def main():
         coms.extend([p.get('scopus_id', p['label']) for x in item['authors']
                      for p in x.get('phd', [])])
         # Remove editors of this and previous year
-        eds_range = range(pub_year-1, pub_year+1)
-        mask = (eds['year'].isin(eds_range)) & (eds['journal'] == item['journal'])
-        cur_editors = set(eds[mask]['scopus_id'])
+        cur_editors = set().union(*[editors.get((journal, y), set())
+                                    for y in range(pub_year-1, pub_year+1)])
         coms = set(coms) - cur_editors
         papers_with += (len(coms) > 0)*1
-        # Add weighted links to this and the next SPAN networks
-        for cur_year in range(pub_year-LEAD, pub_year-LEAD+SPAN):
-            if cur_year < min(DATA_RANGE) or cur_year > max(DATA_RANGE):
-                continue
-            com_links = list(product(coms, auths))
-            # Both network
-            G[cur_year].add_nodes_from(coms)
-            G[cur_year].add_edges_from(com_links)
-            add_attribute(G[cur_year], com_links, 1.0/len(auths))
+        pub_counts[pub_year] += 1
+        links = list(product(coms, auths))
+        sources.extend([c for c, _ in links])
+        targets.extend([a for _, a in links])
+        years.extend([pub_year]*len(links))
+        values.extend([1.0/len(auths)]*len(links))
+    sources = np.array(sources)
+    targets = np.array(targets)
+    years = np.array(years)
+    values = np.array(values)
+
+    # GENERATE NETWORKS
+    for year in DATA_RANGE:
+        first, last = publication_years(year)
+        if not any(first <= y <= last for y in pub_counts):
+            continue
+        mask = (years >= first) & (years <= last)
+        (source, target), weight = sum_weights(
+            [sources[mask], targets[mask]], values[mask])
+        G = nx.DiGraph(name="both")
+        G.add_weighted_edges_from(zip(source.tolist(), target.tolist(),
+                                      weight.tolist()))
+        ouf = (TARGET_FOLDER/str(year)).with_suffix(".npz")
+        write_network(G, ouf)
 
-    # WRITE OUT
-    for year, G in G.items():
-        ouf = (TARGET_FOLDER/str(year)).with_suffix(".gexf")
-        nx.write_gexf(G, ouf)
+    # WRITE OUT TEMPORAL EDGES
+    (com, auth, year), weight = sum_weights([sources, targets, years], values)
+    store = temporal_edge_arrays(com, auth, year, weight, pub_counts,
+                                 directed=True)
+    np.savez_compressed(TEMPORAL_FILE, **store)
 
     # SAVE STATISTICS
     stats = {"N_of_papers_informal": papers_with}
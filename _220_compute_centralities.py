@@ -3,24 +3,100 @@
 """Computes centralities for all nodes of a all networks."""
 
 import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from contextlib import nullcontext
 from pathlib import Path
+from tempfile import TemporaryDirectory
 
 import networkx as nx
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
+
+from _206_build_coauthor_networks import read_gexf, read_network
 
 COAUTHOR_FOLDER = Path("./206_coauthor_networks")
 INFORMAL_FOLDER = Path("./209_informal_networks")
 TARGET_FOLDER = Path("./220_centralities")
+DISTANCE_FOLDER = TARGET_FOLDER/"distances"
+SAMPLE_FILE = Path("./119_NBER_sample/manuscripts.csv")
 
 ATTENUATIONS = list(map(lambda x: x/100.0, list(range(5, 96, 10))))
+BATCH_SIZE = 256  # Number of sources to expand simultaneously
+FRONTIER_CHUNK = 2**24  # Maximum number of neighbors to expand at once
+N_WORKERS = 1  # Number of network-years to compute in parallel
+MEMORY_LIMIT = None  # Maximum memory per worker in GB (None for no limit)
+N_NODE_WORKERS = 1  # Number of processes sharing the nodes of one network
+ONLY_SAMPLE = False  # Compute centralities only for authors and discussants
+ENGINE = "exact"  # Use "hyperanf" to approximate distances in huge networks
+HLL_PRECISION = 10  # HyperLogLog counters use 2**HLL_PRECISION registers
+SCRATCH_FOLDER = None  # Folder to memory-map networks and searches to (None for RAM)
+SCRATCH_MEMORY = 1  # GB of RAM for search frontiers with SCRATCH_FOLDER
+WARM_START = False  # Start eigenvector iteration from previous year's vector
+
+
+def adjacency_arrays(net, nodes):
+    """Return CSR arrays (indptr, indices) of the transposed adjacency
+    matrix, i.e. row i lists the predecessors of node i.
+    """
+    A = nx.adjacency_matrix(net, nodelist=nodes, weight=None).T.tocsr()
+    return A.indptr.astype("int64"), A.indices.astype("int64")
+
+
+def approximate_histograms(indptr, indices, precision=HLL_PRECISION,
+                           max_iter=None):
+    """Estimate the number of nodes at distance k (columns, starting at 1)
+    from each node (rows) on CSR arrays using HyperANF.
+
+    Each node holds a HyperLogLog counter with 2**`precision` registers
+    for the nodes within distance k; in each iteration counters are
+    merged with the counters of the neighbors.  Returns the matrix of
+    estimates and the relative standard error of the counters.
+    """
+    n = len(indptr) - 1
+    m = 2**precision
+    regs = np.zeros((n, m), dtype="uint8")
+    idx, rho = _hash_nodes(n, precision)
+    regs[np.arange(n), idx] = rho
+    # Chunks of rows whose gathered registers use about 64 MB
+    step = max(1, 2**26 // m)
+    bounds = np.unique(np.searchsorted(indptr, np.arange(0, indptr[-1], step),
+                                       side="right") - 1)
+    bounds = np.append(bounds, n)
+    sizes = [_estimate_cardinality(regs)]
+    while max_iter is None or len(sizes) <= max_iter:
+        new = regs.copy()
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            lens = np.diff(indptr[start:end+1])
+            if not lens.any():
+                continue
+            gathered = regs[indices[indptr[start]:indptr[end]]]
+            offsets = (indptr[start:end] - indptr[start])[lens > 0]
+            rows = np.arange(start, end)[lens > 0]
+            merged = np.maximum.reduceat(gathered, offsets, axis=0)
+            new[rows] = np.maximum(new[rows], merged)
+        if np.array_equal(new, regs):
+            break
+        regs = new
+        sizes.append(_estimate_cardinality(regs))
+    hist = np.diff(np.array(sizes), axis=0).T.clip(min=0)
+    return hist, 1.04/np.sqrt(m)
+
 
+def compute_centralities(G, H, degree=True, eigvec=True, katz=True,
+                         weight=None, distances=None, nodes=None):
+    """Return DataFrame with node-wise network measures.
 
-def compute_centralities(G, H, degree=True, eigvec=True, weight=None):
-    """Return DataFrame with node-wise network measures."""
+    Provide `distances` (see count_distances()) to skip the expansion of
+    neighborhoods.  Provide `nodes` to restrict the DataFrame to these
+    nodes.
+    """
     start = time.time()
     # Neighborhood centrality
-    df = discounted_neighborhood(G)
+    if distances is None:
+        distances = count_distances(G, nodes)
+    df = weight_distances(distances)
     print("... computing other centralities")
     label = ""
     if weight:
@@ -31,36 +107,241 @@ def compute_centralities(G, H, degree=True, eigvec=True, weight=None):
     if eigvec:
         df["eigenvector" + label] = pd.Series(
             nx.eigenvector_centrality_numpy(G, weight=weight))
+    if katz:
+        all_nodes = sorted(G.nodes())
+        A = nx.adjacency_matrix(G, nodelist=all_nodes, weight=weight).T
+        katz_df = katz_centralities(A.tocsr(), all_nodes).add_suffix(label)
+        df = df.join(katz_df, how="left")
     diff = time.strftime("%H:%M:%S", time.gmtime(time.time() - start))
     print("... Time for computation:", diff)
     return df
 
 
+def compute_centralities_csr(A, all_nodes, directed, degree=True,
+                             eigvec=True, katz=True, distances=None,
+                             nodes=None):
+    """Like compute_centralities(), but for a connected network given by
+    its sparse transposed adjacency matrix `A` and its sorted nodes.
+    """
+    start = time.time()
+    # Neighborhood centrality
+    if distances is None:
+        distances = count_distances_csr(A.indptr.astype("int64"),
+                                        A.indices.astype("int64"),
+                                        all_nodes, nodes)
+    df = weight_distances(distances)
+    print("... computing other centralities")
+    # Other centralities
+    if degree:
+        df["degree"] = degrees(A, all_nodes, directed)
+    if eigvec:
+        df["eigenvector"] = eigenvector_numpy(A, all_nodes)
+    if katz:
+        df = df.join(katz_centralities(A, all_nodes), how="left")
+    diff = time.strftime("%H:%M:%S", time.gmtime(time.time() - start))
+    print("... Time for computation:", diff)
+    return df
+
+
+def count_distances(net, nodes=None, engine=ENGINE):
+    """Return DataFrame with the number of nodes at distance k (columns)
+    from each node (index).
+
+    Provide `nodes` to only expand the neighborhoods of these nodes.  With
+    engine="hyperanf" the numbers are estimated for all nodes using
+    HyperLogLog counters.
+    """
+    all_nodes = sorted(net.nodes())
+    indptr, indices = adjacency_arrays(net, all_nodes)
+    return count_distances_csr(indptr, indices, all_nodes, nodes, engine)
+
+
+def count_distances_csr(indptr, indices, all_nodes, nodes=None, engine=ENGINE,
+                        scratch=None):
+    """Like count_distances(), but for a network given by the CSR arrays of
+    its transposed adjacency matrix and the list of its nodes (in any
+    order).
+
+    Provide folder `scratch` to search out of core: the visited nodes are
+    memory-mapped there and sources are expanded in batches small enough
+    for their frontiers to fit into SCRATCH_MEMORY.
+    """
+    print("... computing neighborhood centrality")
+    if engine == "hyperanf":
+        hist, error = approximate_histograms(indptr, indices)
+        print(f"... relative standard error of estimates: {error:.2%}")
+        df = pd.DataFrame(hist, index=all_nodes,
+                          columns=range(1, hist.shape[1]+1))
+        if nodes is not None:
+            df = df.loc[sorted(set(nodes).intersection(all_nodes))]
+        return df
+    if nodes is None:
+        nodes = all_nodes
+        sources = None
+    else:
+        nodes = sorted(set(nodes).intersection(all_nodes))
+        sources = pd.Index(all_nodes).get_indexer(nodes)
+    if scratch:
+        # Frontiers hold a key, row and column (int64) per source and node
+        budget = int(SCRATCH_MEMORY*1024**3) // (24*len(all_nodes))
+        hist = distance_histograms(indptr, indices, sources,
+                                   batch_size=max(1, min(budget, BATCH_SIZE)),
+                                   scratch=scratch)
+    elif N_NODE_WORKERS > 1:
+        hist = parallel_histograms(indptr, indices, sources, N_NODE_WORKERS)
+    else:
+        hist = distance_histograms(indptr, indices, sources)
+    return pd.DataFrame(hist, index=nodes, columns=range(1, hist.shape[1]+1))
+
+
+def degrees(A, nodes, directed):
+    """Return degree of nodes from sparse transposed adjacency matrix,
+    counting self-loops twice like nx.degree().
+    """
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    if directed:
+        degree = degree + np.asarray(A.sum(axis=0)).ravel()
+    else:
+        degree = degree + A.diagonal()
+    return pd.Series(degree, index=nodes)
+
+
 def discounted_neighborhood(net):
     """Compute discounted neighborhood centrality."""
-    print("... computing neighborhood centrality")
-    nodes = sorted(net.nodes())
-    M_sum = G = M = nx.adjacency_matrix(net, nodelist=nodes, weight=None).todense()
-    I = np.identity(len(G))
-    # First iteration
-    idx = 1
-    vec = np.array(M.sum(axis=0))[0]
-    centr = {alpha: (alpha**idx)*vec for alpha in ATTENUATIONS}
-    # All other iterations
-    while np.any(M):
-        idx += 1
-        W = np.matmul(M, G)
-        Z = W.clip(max=1) - (I + M_sum)
-        M = Z.clip(min=0)
-        vec = np.array(M.sum(axis=0))[0]
-        centr = {alpha: np.add(old, (alpha**idx) * vec) for
-                 alpha, old in centr.items()}
-        M_sum = np.add(M_sum, M)
-    # Create DataFrame from dictionary
-    df = pd.DataFrame.from_dict(centr)
-    df.index = nodes
-    df.columns = [f"neighborhood_{int(alpha*100)}" for alpha in df.columns]
-    return df
+    return weight_distances(count_distances(net))
+
+
+def distance_histograms(indptr, indices, sources=None, batch_size=BATCH_SIZE,
+                        scratch=None):
+    """Return matrix with the number of nodes first reached at distance
+    k (columns, starting at 1) from each source (rows) by breadth-first
+    search on CSR arrays.
+
+    Sources are expanded in batches, and frontiers in chunks of at most
+    FRONTIER_CHUNK neighbors.  Memory then grows with the number of edges,
+    the batch size times the number of nodes (for the visited nodes and
+    the frontier, which holds up to this many int64 pairs) and the chunk
+    size.  Provide folder `scratch` to keep the visited nodes in a
+    memory-mapped file; the CSR arrays may be memory-mapped as well.
+    """
+    n = len(indptr) - 1
+    if sources is None:
+        sources = np.arange(n)
+    sources = np.asarray(sources, dtype="int64")
+    shape = (min(batch_size, len(sources)), n)
+    if scratch:
+        visited = np.lib.format.open_memmap(scratch/"visited.npy", mode="w+",
+                                            dtype=bool, shape=shape)
+    else:
+        visited = np.zeros(shape, dtype=bool)
+    hists = []
+    for start in range(0, len(sources), batch_size):
+        batch = sources[start:start+batch_size]
+        size = len(batch)
+        visited[:] = False
+        rows = np.arange(size)
+        cols = batch
+        counts = []
+        while rows.size:
+            frontier = []
+            for chunk in _frontier_chunks(indptr, cols, FRONTIER_CHUNK):
+                new_rows, new_cols = _expand_frontier(
+                    indptr, indices, rows[chunk], cols[chunk])
+                if counts:  # Self-loops only count as first neighbor
+                    mask = ~visited[new_rows, new_cols]
+                    new_rows, new_cols = new_rows[mask], new_cols[mask]
+                keys = np.unique(new_rows*n + new_cols)
+                visited[keys // n, keys % n] = True
+                frontier.append(keys)
+            if not counts:
+                visited[np.arange(size), batch] = True
+            keys = np.concatenate(frontier)
+            rows, cols = keys // n, keys % n
+            counts.append(np.bincount(rows, minlength=size))
+        hists.append(np.array(counts[:-1], dtype="int64").reshape(-1, size).T)
+    return _stack_histograms(hists)
+
+
+def eigenvector_centrality(A, nodes, start=None, tol=1e-12, max_iter=10000):
+    """Return eigenvector centrality from power iteration on the sparse
+    transposed adjacency matrix, optionally starting from Series `start`.
+
+    Like nx.eigenvector_centrality_numpy() the vector has unit length.
+    Nodes missing in `start` start with its mean value.
+    """
+    t0 = time.time()
+    A = A.astype("float64")
+    if start is None:
+        x = np.ones(len(nodes))
+    else:
+        start = start.abs()
+        x = start.reindex(nodes).fillna(start.mean()).values
+        if not x.any():
+            x = np.ones(len(nodes))
+    x = x/np.linalg.norm(x)
+    # Iterate with A + I to prevent oscillation in bipartite components
+    for n_iter in range(1, max_iter+1):
+        x_new = A.dot(x) + x
+        x_new = x_new/np.linalg.norm(x_new)
+        converged = np.abs(x_new - x).sum() < len(nodes)*tol
+        x = x_new
+        if converged:
+            break
+    else:
+        print(f"... eigenvector centrality did not converge in {max_iter:,} "
+              "iterations")
+    diff = time.time() - t0
+    print(f"... eigenvector centrality after {n_iter:,} iterations "
+          f"({diff:.2f} seconds)")
+    return pd.Series(x, index=nodes)
+
+
+def eigenvector_numpy(A, nodes, max_iter=50):
+    """Return eigenvector centrality from sparse transposed adjacency
+    matrix using ARPACK, like nx.eigenvector_centrality_numpy() but with
+    a fixed start vector.
+    """
+    from scipy.sparse.linalg import eigs
+
+    v0 = np.ones(A.shape[0])  # Fixed start for reproducible results
+    _, vec = eigs(A.astype("float64"), k=1, which="LR", maxiter=max_iter,
+                  tol=0, v0=v0)
+    largest = vec.flatten().real
+    norm = np.sign(largest.sum()) * np.linalg.norm(largest)
+    return pd.Series(largest/norm, index=nodes)
+
+
+def _estimate_cardinality(regs):
+    """Return HyperLogLog estimates for each row of registers."""
+    m = regs.shape[1]
+    alpha = 0.7213/(1 + 1.079/m)
+    raw = alpha * m**2 / np.power(2.0, -regs.astype("float64")).sum(axis=1)
+    zeros = (regs == 0).sum(axis=1)
+    small = (raw <= 2.5*m) & (zeros > 0)
+    raw[small] = m * np.log(m / zeros[small])
+    return raw
+
+
+def _expand_frontier(indptr, indices, rows, cols):
+    """Return (row, neighbor) pairs for all pairs in the frontier."""
+    starts = indptr[cols]
+    lens = indptr[cols+1] - starts
+    offsets = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+    return np.repeat(rows, lens), indices[np.repeat(starts, lens) + offsets]
+
+
+def _frontier_chunks(indptr, cols, max_pairs=FRONTIER_CHUNK):
+    """Yield slices of frontier `cols` with at most `max_pairs` neighbors
+    (or the neighbors of one node) each.
+    """
+    ends = np.cumsum(indptr[cols+1] - indptr[cols])
+    start = 0
+    while start < len(cols):
+        offset = ends[start-1] if start else 0
+        stop = np.searchsorted(ends, offset + max_pairs, side="right")
+        stop = max(stop, start+1)
+        yield slice(start, stop)
+        start = stop
 
 
 def giant(H):
@@ -73,27 +354,378 @@ def giant(H):
     return H.subgraph(components[0])
 
 
-def main():
-    files = INFORMAL_FOLDER.glob("*.gexf")
-    files.extend(COAUTHOR_FOLDER.glob("*.gexf"))
+def giant_component(indptr, indices, nodes, directed=False):
+    """Return CSR arrays and node IDs of the giant (weakly) connected
+    component of a network given by CSR arrays and array of node IDs.
 
-    print(">>> Now working on:")
+    Nodes of the component keep their relative order.
+    """
+    from scipy.sparse.csgraph import connected_components
+
+    n = len(indptr) - 1
+    A = csr_matrix((np.ones(len(indices), dtype="int8"), indices, indptr),
+                   shape=(n, n))
+    _, labels = connected_components(A, directed=directed, connection="weak")
+    keep = np.flatnonzero(labels == np.bincount(labels).argmax())
+    A = A[keep][:, keep]
+    return (A.indptr.astype("int64"), A.indices.astype("int64"),
+            np.asarray(nodes)[keep])
+
+
+def _hash_nodes(n, precision):
+    """Return register index and rank of the first set bit for nodes
+    0, ..., n-1 from a 64-bit mix hash (SplitMix64).
+    """
+    z = np.arange(n, dtype="uint64") + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    bits = 64 - precision
+    idx = (z >> np.uint64(bits)).astype("int64")
+    w = z & np.uint64(2**bits - 1)
+    length = np.zeros(n, dtype="int64")
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = w >= np.uint64(2**shift)
+        length[mask] += shift
+        w[mask] >>= np.uint64(shift)
+    length += (w > 0)
+    return idx, (bits - length + 1).astype("uint8")
+
+
+def katz_centralities(A, nodes, alphas=ATTENUATIONS, tol=1e-12,
+                      max_iter=10000, min_radius=1e-10):
+    """Return DataFrame with Katz centrality for each attenuation factor in
+    `alphas` from sparse transposed adjacency matrix, using one sequence
+    of sparse matrix-vector products.
+
+    Attenuation factors are relative to the radius of convergence, i.e.
+    they are divided by the spectral radius of the adjacency matrix.
+    In acyclic directed networks (or if it is below `min_radius`) all
+    walks are finite and the factors are used as they are.
+    Like nx.katz_centrality() each vector has unit length.
+    """
+    A = A.astype("float64")
+    lam = spectral_radius(A)
+    if lam > min_radius:  # Iterate on scaled matrix to avoid overflow
+        A = A/lam
+    # Sum attenuated walks of increasing length for all factors at once;
+    # the walks of length 0 ensure that all entries are at least 1
+    alphas = np.array(list(alphas))
+    w = np.ones(len(nodes))
+    centr = np.ones((len(nodes), len(alphas)))
+    for idx in range(1, max_iter+1):
+        w = A.dot(w)
+        centr = centr + np.outer(w, alphas**idx)
+        if (alphas**idx).max() * w.max() < tol:
+            break
+    centr = centr/np.linalg.norm(centr, axis=0)
+    labels = [f"katz_{round(alpha*100)}" for alpha in alphas]
+    return pd.DataFrame(centr, index=nodes, columns=labels)
+
+
+def limit_memory(limit):
+    """Restrict address space of current process to `limit` GB."""
+    import resource
+    size = int(limit * 1024**3)
+    resource.setrlimit(resource.RLIMIT_AS, (size, size))
+
+
+def load_network(file, scratch=None):
+    """Return sorted node IDs, sparse adjacency matrix (rows are sources)
+    and whether the network is directed for .npz or .gexf files.
+
+    Provide folder `scratch` to memory-map the matrix there.
+    """
+    reader = read_network if file.suffix == ".npz" else read_gexf
+    nodes, A, directed, _ = reader(file, with_info=True)
+    if scratch:
+        A = memmap_matrix(csr_matrix(A), scratch, "network")
+    return nodes, A, directed
+
+
+def memmap_arrays(folder, prefix, **arrays):
+    """Write `arrays` to .npy files in `folder` and return them (in the
+    given order) as read-only memory maps.
+    """
+    maps = []
+    for name, arr in arrays.items():
+        fname = folder/f"{prefix}_{name}.npy"
+        np.save(fname, arr)
+        maps.append(np.load(fname, mmap_mode="r"))
+    return maps
+
+
+def memmap_matrix(A, folder, prefix):
+    """Return sparse CSR matrix `A` with its arrays memory-mapped to
+    .npy files in `folder`.
+    """
+    data, indices, indptr = memmap_arrays(
+        folder, prefix, data=A.data, indices=A.indices, indptr=A.indptr)
+    return csr_matrix((data, indices, indptr), shape=A.shape)
+
+
+def network_centralities(all_nodes, A, directed, nodes=None,
+                         eigvec_start=None, scratch=None):
+    """Compute centralities for the giant component of the network with
+    sparse adjacency matrix `A` (rows are sources).
+
+    Provide `nodes` to restrict the computation to these nodes.  With
+    WARM_START, eigenvector centrality starts from `eigvec_start`.
+    Provide folder `scratch` to memory-map the giant component there and
+    search distances out of core.
+    Returns the centralities, the distance counts and the eigenvector
+    centrality (None without WARM_START).
+    """
+    A = csr_matrix(A).T.tocsr()
+    indptr, indices, giant_nodes = giant_component(
+        A.indptr, A.indices, all_nodes, directed=directed)
+    n = len(giant_nodes)
+    A = csr_matrix((np.ones(len(indices), dtype="int64"), indices, indptr),
+                   shape=(n, n))
+    if scratch:  # Keep only the memory maps
+        A = memmap_matrix(A, scratch, "giant")
+        indptr, indices = memmap_arrays(scratch, "giant_csr", indptr=indptr,
+                                        indices=indices)
+
+    # Number of nodes at each distance
+    distances = count_distances_csr(indptr, indices, giant_nodes, nodes,
+                                    scratch=scratch)
+
+    # Centralities (with predefined attenuation factors)
+    eigvec = None
+    if WARM_START:
+        eigvec = eigenvector_centrality(A, giant_nodes, start=eigvec_start)
+    centr = compute_centralities_csr(A, giant_nodes, directed,
+                                     eigvec=eigvec is None,
+                                     distances=distances)
+    if eigvec is not None:
+        centr["eigenvector"] = eigvec
+    return centr.sort_index(), distances, eigvec
+
+
+def network_ident(file):
+    """Return identifier of network file, e.g. "coauth_2003"."""
+    year = file.stem
+    if file.parts[-2] == "206_coauthor_networks":
+        net_type = 'coauth'
+    else:
+        net_type = 'informal'
+    return "_".join([net_type, year])
+
+
+def parallel_histograms(indptr, indices, sources=None, n_workers=N_NODE_WORKERS,
+                        batch_size=BATCH_SIZE):
+    """Compute distance_histograms() with batches of sources distributed
+    over `n_workers` processes.
+
+    The CSR arrays are placed in shared memory once instead of being
+    sent to every worker.
+    """
+    if sources is None:
+        sources = np.arange(len(indptr) - 1)
+    batches = [sources[i:i+batch_size] for i in range(0, len(sources), batch_size)]
+    blocks = []
+    specs = []
+    try:
+        for arr in (indptr, indices):
+            shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+            blocks.append(shm)
+            specs.append((shm.name, arr.shape, arr.dtype.str))
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            hists = list(executor.map(_shared_histograms,
+                                      [specs]*len(batches), batches))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    return _stack_histograms(hists)
+
+
+def process_network(file, nodes=None, eigvec_start=None):
+    """Compute centralities for network in `file` and write them out.
+
+    Provide `nodes` to restrict the computation to these nodes.  With
+    WARM_START, eigenvector centrality starts from `eigvec_start`.
+    Returns the identifier of the network and its eigenvector centrality.
+    """
+    # Read in
+    ident = network_ident(file)
+    print(f"... {ident} ...")
+    with (TemporaryDirectory(dir=SCRATCH_FOLDER) if SCRATCH_FOLDER
+          else nullcontext()) as scratch:
+        scratch = scratch and Path(scratch)
+        all_nodes, A, directed = load_network(file, scratch)
+
+        # Compute
+        centr, distances, eigvec = network_centralities(
+            all_nodes, A, directed, nodes, eigvec_start, scratch)
+
+    # Write out
+    DISTANCE_FOLDER.mkdir(exist_ok=True)
+    distances.to_csv((DISTANCE_FOLDER/ident).with_suffix(".csv"),
+                     index_label="node")
+    centr.to_csv((TARGET_FOLDER/ident).with_suffix(".csv"), index_label="node")
+    return ident, eigvec
+
+
+def read_distances(ident):
+    """Read number of nodes at each distance for network `ident`."""
+    fname = (DISTANCE_FOLDER/ident).with_suffix(".csv")
+    df = pd.read_csv(fname, index_col="node")
+    df.columns = df.columns.astype(int)
+    return df
+
+
+def read_sample_nodes():
+    """Read Scopus IDs of authors and discussants in the NBER sample."""
+    nber = pd.read_csv(SAMPLE_FILE, usecols=["author_scopus", "discussant"],
+                       dtype="str")
+    nodes = set()
+    for col in ("author_scopus", "discussant"):
+        nodes.update([a for l in nber[col].dropna() for a in l.split(";")])
+    return nodes
+
+
+def _shared_histograms(specs, sources):
+    """Compute distance_histograms() on CSR arrays in shared memory."""
+    blocks = [shared_memory.SharedMemory(name=name) for name, _, _ in specs]
+    indptr, indices = [np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                       for shm, (_, shape, dtype) in zip(blocks, specs)]
+    hist = distance_histograms(indptr, indices, sources)
+    del indptr, indices  # Release buffers before closing
+    for shm in blocks:
+        shm.close()
+    return hist
+
+
+def spectral_radius(A, dense_size=500, tol=1e-10, max_iter=10000):
+    """Return spectral radius of non-negative sparse matrix `A`, i.e. the
+    largest Perron root of its strongly connected components.
+
+    Components up to `dense_size` nodes are solved densely and larger
+    ones with ARPACK.  When ARPACK does not converge because several
+    eigenvalues share the largest modulus (periodic components), a
+    bounded power iteration on the shifted, aperiodic matrix is used.
+    """
+    from scipy.sparse import identity
+    from scipy.sparse.csgraph import connected_components
+    from scipy.sparse.linalg import ArpackNoConvergence, eigs
+
+    _, labels = connected_components(A, directed=True, connection="strong")
+    sizes = np.bincount(labels)
+    # Single nodes contribute their self-loops only; acyclic networks
+    # thus have radius 0, where ARPACK is inaccurate
+    single = sizes[labels] == 1
+    lam = A.diagonal()[single].max(initial=0)
+    for comp in np.flatnonzero(sizes > 1):
+        idx = np.flatnonzero(labels == comp)
+        B = A[idx][:, idx]
+        if len(idx) <= dense_size:
+            lam = max(lam, np.abs(np.linalg.eigvals(B.toarray())).max())
+            continue
+        try:
+            rho = eigs(B, k=1, which="LM", v0=np.ones(len(idx)),
+                       return_eigenvectors=False)
+            lam = max(lam, np.abs(rho)[0])
+            continue
+        except ArpackNoConvergence:
+            pass
+        # A+I shares the Perron vector of A and has a unique dominant root
+        B = B + identity(len(idx), format="csr")
+        v = np.ones(len(idx))/np.sqrt(len(idx))
+        rho = 0
+        for _ in range(max_iter):
+            w = B.dot(v)
+            new = np.linalg.norm(w)
+            v = w/new
+            if abs(new - rho) < tol*new:
+                break
+            rho = new
+        lam = max(lam, new - 1)
+    return lam
+
+
+def _stack_histograms(hists):
+    """Stack histograms of different lengths vertically."""
+    width = max([h.shape[1] for h in hists] or [0])
+    hists = [np.pad(h, ((0, 0), (0, width-h.shape[1]))) for h in hists]
+    return np.vstack(hists or [np.zeros((0, 0), dtype="int64")])
+
+
+def time_giant(files=None):
+    """Compare the time to extract the giant component as CSR arrays
+    via networkx and via giant_component() for each network file.
+    """
+    if files is None:
+        files = list(INFORMAL_FOLDER.glob("*.gexf"))
+        files.extend(COAUTHOR_FOLDER.glob("*.gexf"))
+    out = {}
     for file in sorted(files):
-        # Read in
-        year = file.name[:-5]
-        if file.parts[-2] == "206_coauthor_networks":
-            net_type = 'coauth'
-        else:
-            net_type = 'informal'
-        ident = "_".join([net_type, year])
-        print(f"... {ident} ...")
         H = nx.read_gexf(file)
+        start = time.time()
         G = giant(H)
+        nx_nodes = sorted(G.nodes())
+        adjacency_arrays(G, nx_nodes)
+        nx_time = time.time() - start
+        start = time.time()
+        nodes = sorted(H.nodes())
+        indptr, indices = adjacency_arrays(H, nodes)
+        _, _, csr_nodes = giant_component(indptr, indices, nodes,
+                                          directed=H.is_directed())
+        csr_time = time.time() - start
+        if list(csr_nodes) != nx_nodes:
+            print(f">>> Giant components of {file} differ")
+        out[network_ident(file)] = {"nodes": len(csr_nodes),
+                                    "networkx": nx_time, "csgraph": csr_time}
+    df = pd.DataFrame(out).T[["nodes", "networkx", "csgraph"]]
+    df["speedup"] = df["networkx"]/df["csgraph"]
+    print(df)
+    return df
 
-        # Centralities (with predefined attenuation factors)
-        centr = compute_centralities(G, H, weight=None).sort_index()
-        centr.to_csv((TARGET_FOLDER/ident).with_suffix(".csv"), index_label="node")
 
+def weight_distances(distances, alphas=ATTENUATIONS):
+    """Compute discounted neighborhood centrality for each attenuation
+    factor in `alphas` from the number of nodes at each distance.
+    """
+    hist = distances.values
+    alphas = list(alphas)
+    centr = np.zeros((hist.shape[0], len(alphas)))
+    for idx in range(1, hist.shape[1]+1):
+        weights = np.array([alpha**idx for alpha in alphas])
+        centr = np.add(centr, weights * hist[:, idx-1, None])
+    labels = [f"neighborhood_{round(alpha*100)}" for alpha in alphas]
+    return pd.DataFrame(centr, index=distances.index, columns=labels)
+
+
+def main():
+    files = {}
+    for folder in (INFORMAL_FOLDER, COAUTHOR_FOLDER):
+        for file in sorted(folder.glob("*.gexf")) + sorted(folder.glob("*.npz")):
+            files[network_ident(file)] = file  # Prefer binary format
+    files = list(files.values())
+
+    nodes = None
+    if ONLY_SAMPLE:
+        nodes = read_sample_nodes()
+        print(f">>> Restricting computation to {len(nodes):,} nodes")
+
+    print(">>> Now working on:")
+    if N_WORKERS == 1:
+        previous = {}
+        for file in sorted(files):
+            net_type = file.parts[-2]
+            _, previous[net_type] = process_network(
+                file, nodes, previous.get(net_type))
+    else:  # Start with largest networks to balance workload
+        files = sorted(files, key=lambda f: f.stat().st_size, reverse=True)
+        init_args = {}
+        if MEMORY_LIMIT:
+            init_args = {"initializer": limit_memory, "initargs": (MEMORY_LIMIT,)}
+        with ProcessPoolExecutor(max_workers=N_WORKERS, **init_args) as executor:
+            for ident, _ in executor.map(process_network, files,
+                                         [nodes]*len(files)):
+                print(f"... {ident} done")
 
 if __name__ == '__main__':
     main()
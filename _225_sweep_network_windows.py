@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# Author:   Michael E. Rose <michael.ernst.rose@gmail.com>
+"""Computes centralities of co-author and informal networks for a grid
+of network windows (SPAN, LEAD) from the temporal edge records.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+from _012_list_presentations import DATA_RANGE
+from _206_build_coauthor_networks import materialize_network,\
+    publication_years, read_temporal_edges
+from _220_compute_centralities import network_centralities, read_sample_nodes
+
+STORE_FILES = {"coauth": Path("./206_coauthor_networks/temporal_edges.npz"),
+               "informal": Path("./209_informal_networks/temporal_edges.npz")}
+TARGET_FILE = Path("./225_window_sweep/centralities.csv")
+
+WINDOWS = [(1, 0), (2, 1), (3, 1), (3, 2), (4, 2), (5, 2)]  # (SPAN, LEAD)
+N_WORKERS = 1  # Number of windows to compute in parallel
+ONLY_SAMPLE = False  # Compute centralities only for authors and discussants
+
+
+def list_windows(windows=WINDOWS):
+    """Return dict mapping each distinct window (network type, first
+    and last publication year) to the (SPAN, LEAD, year) configurations
+    using it.  Skips windows not covered by the temporal edge records.
+    """
+    out = defaultdict(list)
+    for net_type, fname in STORE_FILES.items():
+        years = load_store(fname)["years"]
+        for span, lead in windows:
+            for year in DATA_RANGE:
+                first, last = publication_years(year, span, lead)
+                if first < years.min() or last > years.max():
+                    print(f"... skipping {net_type} {year} for SPAN={span}, "
+                          f"LEAD={lead}: no data for {first}-{last}")
+                    continue
+                out[(net_type, first, last)].append((span, lead, year))
+    return out
+
+
+@lru_cache(maxsize=None)
+def load_store(fname):
+    """Read temporal edge records once per process."""
+    return read_temporal_edges(fname)
+
+
+def process_window(window, nodes=None):
+    """Compute centralities for the network of publications in
+    `window` = (network type, first and last publication year).
+    """
+    net_type, first, last = window
+    print(f"... {net_type} {first}-{last} ...")
+    store = load_store(STORE_FILES[net_type])
+    all_nodes, A = materialize_network(store, last, span=last-first+1, lead=0)
+    centr, _, _ = network_centralities(all_nodes.astype(str), A,
+                                       bool(store["directed"]), nodes)
+    return window, centr
+
+
+def main():
+    windows = list_windows(WINDOWS)
+    n_configs = sum(len(v) for v in windows.values())
+    print(f">>> Computing {len(windows):,} distinct windows for "
+          f"{n_configs:,} network-years")
+    nodes = None
+    if ONLY_SAMPLE:
+        nodes = read_sample_nodes()
+        print(f">>> Restricting computation to {len(nodes):,} nodes")
+
+    # Compute, starting with widest windows to balance workload
+    tasks = sorted(windows, key=lambda w: w[1] - w[2])
+    if N_WORKERS == 1:
+        results = [process_window(t, nodes) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=N_WORKERS) as executor:
+            results = list(executor.map(process_window, tasks,
+                                        [nodes]*len(tasks)))
+
+    # Expand to all configurations sharing a window
+    out = []
+    for window, centr in results:
+        centr = centr.rename_axis("node").reset_index()
+        for span, lead, year in windows[window]:
+            keys = pd.DataFrame({"network": window[0], "span": span,
+                                 "lead": lead, "year": year},
+                                index=centr.index)
+            out.append(pd.concat([keys, centr], axis=1))
+
+    # Write out
+    out = pd.concat(out).sort_values(["network", "span", "lead", "year", "node"])
+    TARGET_FILE.parent.mkdir(exist_ok=True)
+    out.to_csv(TARGET_FILE, index=False)
+
+
+if __name__ == '__main__':
+    main()
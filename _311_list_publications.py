@@ -7,7 +7,8 @@ and each discussant.
 from pathlib import Path
 
 import pandas as pd
-from tqdm import tqdm
+
+from _003_harvest_researchers import get_documents
 
 NBER_FILE = Path("./119_NBER_sample/manuscripts.csv")
 TARGET_FILE = Path("./311_publication_lists/publications.csv")
@@ -16,30 +17,6 @@ YEAR_CUTOFF = 2014
 DOC_TYPES = ("re", "ar", "cp", "no", "ip", "sh")
 
 
-def parse_publications(res):
-    """Return EIDs, publication name (source) and publication year."""
-    return [(p.eid, p.publicationName, p.coverDate[:4]) for p in res
-            if int(p.coverDate[:4]) < YEAR_CUTOFF and p.subtype in DOC_TYPES]
-
-
-def perform_query(q, refresh=100):
-    """Access ScopusSearch API to retrieve EIDs, sources and
-    publication years.
-    """
-    from pybliometrics.scopus import ScopusSearch
-
-    try:
-        res = ScopusSearch(q, refresh=refresh).results
-        info = parse_publications(res)
-    except (KeyError, TypeError):
-        res = ScopusSearch(q, refresh=True).results
-        info = parse_publications(res)
-    if not info:
-        return None, None, None
-    eids, sources, years = zip(*info)
-    return eids, sources, years
-
-
 def main():
     # Authors and Discussants of NBER sample
     nber = pd.read_csv(NBER_FILE, usecols=["author_scopus", "discussant"],
@@ -49,22 +26,25 @@ def main():
                        if a.isnumeric()])
     researchers = authors | discussants
     researchers.remove("-")
+    researchers = sorted(researchers)
 
     # List publications
-    out = {}
     print(f">>> Parsing publications of {len(researchers):,} researchers")
-    for auth_id in tqdm(researchers):
-        q = f"AU-ID({auth_id})"
+    docs = get_documents(researchers)
+    mask = (docs["year"] < YEAR_CUTOFF) & docs["subtype"].isin(DOC_TYPES)
+    docs = docs[mask].fillna({"source": "-"})  # Replace missing journal names
+    docs["year"] = docs["year"].astype(str)
+    out = {}
+    grouped = docs.groupby("researcher", sort=False)
+    for auth_id in researchers:
         try:
-            eids, sources, years = perform_query(q)
-        except Exception as e:
-            print(auth_id, e)
-        if not eids or not sources or not years:
+            pubs = grouped.get_group(auth_id)
+        except KeyError:
             print(f"{auth_id} lacks information")
             continue
-        sources = [s or "-" for s in sources]  # Replace missing journal names
-        out[auth_id] = {"eids": "|".join(eids), "sources": "|".join(sources),
-                        "years": "|".join(years)}
+        out[auth_id] = {"eids": "|".join(pubs["eid"]),
+                        "sources": "|".join(pubs["source"]),
+                        "years": "|".join(pubs["year"])}
 
     # Write out
     df = pd.DataFrame(out).T.sort_index()
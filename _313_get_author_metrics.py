@@ -6,30 +6,60 @@ index of citations.
 You need a special API key by Scopus to access the citation view.
 """
 
+from collections import defaultdict
 from pathlib import Path
 
 import pandas as pd
 from scholarmetrics import euclidean
-from pybliometrics.scopus import CitationOverview
-from tqdm import tqdm
+
+from _002_query_Scopus import map_queries, query
 
 SOURCE_FILE = Path("./311_publication_lists/publications.csv")
 TARGET_FILE = Path("./313_author_metrics/metrics.csv")
 
+BATCH_SIZE = 25  # Maximum number of documents per CitationOverview request
+
 
 def compute_euclid(df):
     """Return yearly Euclidean index except when all entries are nan."""
     return df.dropna(how="all", axis=1).cumsum(axis=1).apply(euclidean)
 
 
-def get_yearly_citations(sid, pubyear, refresh=False):
-    """Return dict of yearly citations."""
+def get_yearly_citations(sids, pubyear, refresh=False):
+    """Return list of dicts of yearly citations for documents published
+    in the same year, using one request.
+
+    Results are matched to `sids` by the Scopus IDs in the response.  If
+    the request fails or misses documents, both halves of `sids` are
+    requested separately.
+    """
     try:
-        co = CitationOverview([sid], pubyear, refresh=refresh)
-        return {y: c for y, c in co.cc[0] if int(y) < 2021}
+        co = query("CitationOverview", list(sids), pubyear, refresh=refresh)
+        cites = dict(zip(co.scopus_id, co.cc))
+        missing = [sid for sid in sids if int(sid) not in cites]
+        if missing:
+            raise ValueError(f"No results for {len(missing)} of {len(sids)} "
+                             "documents")
+        return [{y: c for y, c in cites[int(sid)] if int(y) < 2021}
+                for sid in sids]
     except Exception as e:
-        print(e, sid)
-        return {}
+        if len(sids) == 1:
+            print(e, sids[0])
+            return [{}]
+    half = len(sids)//2
+    return (get_yearly_citations(sids[:half], pubyear, refresh) +
+            get_yearly_citations(sids[half:], pubyear, refresh))
+
+
+def make_batches(info, size=BATCH_SIZE):
+    """Group (Scopus ID, publication year)-pairs into batches of at most
+    `size` Scopus IDs with the same publication year.
+    """
+    by_year = defaultdict(list)
+    for sid, year in info:
+        by_year[year].append(sid)
+    return [(sids[i:i+size], year) for year, sids in sorted(by_year.items())
+            for i in range(0, len(sids), size)]
 
 
 def nan_preserving_sum(df):
@@ -48,10 +78,16 @@ def main():
     eids["sid"] = eids["eid"].str.split("-").str[-1]
 
     # Yearly citation count
-    info = set(zip(eids["sid"], years["year"]))
-    print(f">>> Searching yearly citation counts for {len(info):,} articles")
-    yearly_cites = {e: get_yearly_citations(e, y) for e, y in tqdm(info)}
+    info = sorted(set(zip(eids["sid"], years["year"])))
+    batches = make_batches(info)
+    print(f">>> Searching yearly citation counts for {len(info):,} articles "
+          f"in {len(batches):,} requests")
+    results = map_queries(lambda b: get_yearly_citations(*b), batches,
+                          checkpoint="citations")
+    yearly_cites = {e: cites for (sids, _), res in zip(batches, results)
+                    for e, cites in zip(sids, res)}
     yearly_cites = pd.DataFrame(yearly_cites).T
+    yearly_cites.columns = yearly_cites.columns.astype(int)
     yearly_cites = yearly_cites[sorted(yearly_cites.columns)]
     eid_cites = eids.join(yearly_cites, on="sid")
     eid_cites = eid_cites.drop(columns=["eid", "sid"]).set_index("researcher")
@@ -6,9 +6,9 @@ from collections import Counter, defaultdict
 from pathlib import Path
 
 import pandas as pd
-from pybliometrics.scopus import AffiliationRetrieval, ScopusSearch
-from tqdm import tqdm
 
+from _002_query_Scopus import map_queries, query
+from _003_harvest_researchers import get_documents
 from _311_list_publications import DOC_TYPES, YEAR_CUTOFF
 
 CENTRALITIES_FOLDER = Path("./220_centralities/")
@@ -16,9 +16,12 @@ METRICS_FILE = Path("./313_author_metrics/metrics.csv")
 GENDER_FILE = Path("./030_gender_estimates/genderize.csv")
 EDITOR_FOLDER = Path("./035_person_auxiliary/")
 TARGET_FILE = Path("./440_person_data/all.csv")
+AFFILIATION_FILE = Path("./440_person_data/affiliation_types.csv")
 
 FILTER_INSTITUTIONS = {"60020337", "60016621"}
 
+_org_types = {}
+
 
 def find_most_common(s):
     """Return most common entry from a list."""
@@ -28,29 +31,44 @@ def find_most_common(s):
         return None
 
 
+def get_affiliation_ids(docs, auth_id):
+    """Find affiliation IDs of an author by year."""
+    new = defaultdict(lambda: list())
+    for p in docs.itertuples():
+        auth_idx = p.author_ids.split(";").index(str(auth_id))
+        try:
+            affs = p.author_afids.split(";")[auth_idx]
+        except (AttributeError, ValueError):
+            continue
+        for aff_id in affs.split("-"):
+            if aff_id not in FILTER_INSTITUTIONS:
+                new[p.year].append(aff_id)
+    return new
+
+
+def get_org_type(aff_id):
+    """Return type of an affiliation, or None if the query fails."""
+    try:
+        return query("AffiliationRetrieval", aff_id).org_type
+    except Exception as e:
+        print(aff_id, e)
+        return None
+
+
 def get_yearly_affiliation_types(author_ids):
     """Find yearly affiliations for each author."""
+    author_ids = list(author_ids)
+    docs = get_documents(author_ids)
+    mask = docs["year"].between(1998, YEAR_CUTOFF) & docs["subtype"].isin(DOC_TYPES)
+    aff_ids = {auth_id: get_affiliation_ids(pubs, auth_id)
+               for auth_id, pubs in docs[mask].groupby("researcher")}
+    update_org_types({a for d in aff_ids.values() for ids in d.values()
+                      for a in ids})
     affiliations = {}
-    for auth_id in tqdm(author_ids):
-        s = ScopusSearch(f"AU-ID({auth_id})")
-        new = defaultdict(lambda: list())
-        for p in s.results:
-            year = int(p.coverDate[:4])
-            if year < 1998 or year > YEAR_CUTOFF:
-                continue
-            if p.subtype not in DOC_TYPES:
-                continue
-            auth_idx = p.author_ids.split(";").index(str(auth_id))
-            try:
-                affs = p.author_afids.split(";")[auth_idx]
-                for aff_id in affs.split("-"):
-                    if aff_id in FILTER_INSTITUTIONS:
-                        continue
-                    aff = AffiliationRetrieval(aff_id)
-                    new[year].append(aff.org_type)
-            except (AttributeError, ValueError):
-                continue
-        affiliations[auth_id] = new
+    for auth_id in author_ids:
+        by_year = aff_ids.get(str(auth_id), {})
+        affiliations[auth_id] = {year: [_org_types[a] for a in affs]
+                                 for year, affs in by_year.items()}
     return affiliations
 
 
@@ -66,6 +84,28 @@ def read_centralities(files):
     return df.reset_index().sort_values(['node', 'year'])
 
 
+def read_org_types():
+    """Read affiliation type store into memory."""
+    try:
+        df = pd.read_csv(AFFILIATION_FILE, dtype=str, keep_default_na=False)
+    except FileNotFoundError:
+        return
+    _org_types.update(zip(df["aff_id"], df["org_type"].replace({"": None})))
+
+
+def update_org_types(aff_ids):
+    """Look up types of affiliations missing in the affiliation type
+    store concurrently (checkpointing the lookups) and write out the store.
+    """
+    missing = sorted(set(aff_ids) - set(_org_types))
+    print(f"... {len(aff_ids) - len(missing):,} store hits and "
+          f"{len(missing):,} misses for {len(aff_ids):,} affiliations")
+    types = map_queries(get_org_type, missing, checkpoint="affiliation_types")
+    _org_types.update(zip(missing, types))
+    store = pd.Series(_org_types, name="org_type", dtype=object)
+    store.sort_index().to_csv(AFFILIATION_FILE, index_label="aff_id")
+
+
 def main():
     # Read in
     df = pd.read_csv(METRICS_FILE)
@@ -73,6 +113,7 @@ def main():
 
     # Compute affiliation type
     print(">>> Finding yearly affiliation types")
+    read_org_types()
     types = get_yearly_affiliation_types(df["researcher"].unique())
     types = pd.DataFrame.from_dict(types).T.reset_index()
     types = types.rename(columns={"index": "researcher"})
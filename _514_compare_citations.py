@@ -9,9 +9,8 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
-from pybliometrics.scopus import AbstractRetrieval, ScopusSearch
-from tqdm import tqdm
 
+from _002_query_Scopus import map_queries, query
 from _119_prepare_NBER_data import figure_font, figure_params
 
 mpl.rc('font', **figure_font)
@@ -29,6 +28,25 @@ def citer_cited_comparison(s, find_col="discussant"):
         return 0
 
 
+def get_citing_authors(eid):
+    """Return authors of citing documents by years since publication."""
+    ab = query("AbstractRetrieval", eid, view="FULL")
+    pub_year = int(ab.coverDate[:4])
+    q = f"REF({eid})"
+    res = robust_query(q, integrity=["eid", "coverDate"])
+    cites = {}
+    for p in res:
+        year = int(p.coverDate[:4])
+        if year >= datetime.now().year or not p.author_ids:
+            continue
+        delta = year - pub_year
+        try:
+            cites[delta] += "-" + p.author_ids
+        except KeyError:
+            cites[delta] = p.author_ids
+    return cites
+
+
 def join_lists(s):
     """Join multiple lists."""
     return [x for l in s for x in l]
@@ -115,16 +133,13 @@ def make_citations_lineplot(df, fname, probablity=True):
     plt.clf()
 
 
-def robust_query(q, integrity, refresh=100):
+def robust_query(q, integrity):
     """Return query results, attempt to refresh once."""
     try:
-        res = ScopusSearch(q, integrity_fields=integrity, refresh=refresh).results
+        res = query("ScopusSearch", q, integrity_fields=integrity).results
     except AttributeError:
-        try:
-            res = ScopusSearch(q, integrity_fields=integrity, refresh=True).results
-        except AttributeError:
-            res = ScopusSearch(q).results
-            print(f"...missing fields {', '.join(integrity)} persist")
+        res = query("ScopusSearch", q).results
+        print(f"...missing fields {', '.join(integrity)} persist")
     return res or []
 
 
@@ -148,24 +163,9 @@ def main():
     eids = nber["eid"].unique()
     total = len(eids)
     print(f">>> Downloading referencing information for {total:,} articles")
-    out = {}
-    for eid in tqdm(eids):
-        ab = AbstractRetrieval(eid, view="FULL")
-        pub_year = int(ab.coverDate[:4])
-        q = f"REF({eid})"
-        res = robust_query(q, integrity=["eid", "coverDate"])
-        cites = {}
-        for p in res:
-            year = int(p.coverDate[:4])
-            if year >= datetime.now().year or not p.author_ids:
-                continue
-            delta = year - pub_year
-            try:
-                cites[delta] += "-" + p.author_ids
-            except KeyError:
-                cites[delta] = p.author_ids
-        out[eid] = cites
-    refs = pd.DataFrame(out).T
+    out = map_queries(get_citing_authors, eids, checkpoint="citing_authors")
+    refs = pd.DataFrame(dict(zip(eids, out))).T
+    refs.columns = refs.columns.astype(int)
     refs = refs[sorted(refs.columns)]
     df = nber.join(refs, on="eid")
 
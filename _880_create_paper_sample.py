@@ -11,7 +11,7 @@ import pandas as pd
 import seaborn as sns
 from sklearn.preprocessing import MinMaxScaler
 
-from _012_list_presentations import write_stats
+from _012_list_presentations import fetch, write_stats
 from _780_create_discussant_sample import read_data_file
 
 NBER_FILE = Path("./119_NBER_sample/manuscripts.csv")
@@ -56,7 +56,7 @@ def read_sjr(field=2000):
     SJR_URL = "https://raw.githubusercontent.com/Michael-E-Rose/"\
               "SCImagoJournalRankIndicators/master/Scimago_JIFs.csv"
     cols = ['field', 'year', 'SJR', 'h-index', 'avg_citations', 'Sourceid']
-    sjr = pd.read_csv(SJR_URL, usecols=cols, index_col=["Sourceid", "year"])
+    sjr = pd.read_csv(fetch(SJR_URL), usecols=cols, index_col=["Sourceid", "year"])
     if field:
         sjr = sjr[sjr["field"] == field]
     sjr = sjr[sjr["SJR"] > 0].drop(columns="field")